@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import random
+import sys
+import time
+from make_csvs import split_localised
+
+# rough key counts for SWMH+EMF: event/history name keys and max_provinces
+base_names = 5000
+base_provs = 2000
+
+def legacy_split(keys, localisation):
+    found = set()
+    missing = []
+    for key in keys:
+        if key in localisation:
+            found.add(key)
+        elif key not in missing:
+            missing.append(key)
+    return found, missing
+
+def make_keys(scale):
+    rng = random.Random(scale)
+    n_names = base_names * scale
+    n_provs = base_provs * scale
+    # names repeat across history files, so draw with replacement
+    names = ['name_{}'.format(rng.randrange(n_names)) for _ in range(n_names)]
+    keys = names + ['PROV{}'.format(i) for i in range(1, n_provs)]
+    localisation = {k: '' for k in keys if rng.random() < 0.5}
+    return keys, localisation
+
+def bench(func, keys, localisation):
+    start = time.perf_counter()
+    result = func(keys, localisation)
+    return time.perf_counter() - start, result
+
+def main():
+    scales = [int(x) for x in sys.argv[1:]] or [1, 10]
+    for scale in scales:
+        keys, localisation = make_keys(scale)
+        legacy_time, (legacy_found, legacy_missing) = bench(
+            legacy_split, keys, localisation)
+        new_time, (found, missing) = bench(
+            lambda k, l: split_localised(dict.fromkeys(k), l), keys,
+            localisation)
+        assert found == legacy_found and list(missing) == legacy_missing
+        print('{:>3}x ({} keys): list {:.3f} s, ordered set {:.3f} s'.format(
+            scale, len(keys), legacy_time, new_time))
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,25 @@
 #!/usr/bin/env python3
 
 import collections
+import contextlib
 import csv
 import datetime
+import functools
+import hashlib
+import io
+import json
+import multiprocessing
 import re
 import shutil
 import sys
-from ck2parser import (rootpath, files, csv_rows, is_codename, get_cultures,
-                       get_provinces, Obj, Pair, String, SimpleParser,
-                       FullParser)
+from ck2parser import (rootpath, vanilladir, files, csv_rows, is_codename,
+                       get_cultures, get_provinces, Obj, Pair, String,
+                       SimpleParser, FullParser)
 from print_time import print_time
 
 no_provinces = '--no-provinces' in sys.argv[1:]
+# check build against build/manifest.json, which only a full build writes
+verify_only = '--verify' in sys.argv[1:]
 
 version = 'v2.2.31'
 if no_provinces:
@@ -24,9 +32,43 @@ emfpath = rootpath / 'EMF/EMF'
 emfswmhpath = rootpath / 'EMF/EMF+SWMH'
 # emfminipath = rootpath / 'EMF/EMF+MiniSWMH'
 
+templates = sed2path / 'templates'
+templates_sed2 = templates / 'SED2'
+templates_loc = templates_sed2 / 'localisation'
+templates_lt = templates_sed2 / 'common/landed_titles'
+templates_emf_loc = templates / 'SED2+EMF/localisation'
+build = sed2path / 'build'
+build_sed2 = build / 'SED2'
+build_loc = build_sed2 / 'localisation'
+build_lt = build_sed2 / 'common/landed_titles'
+build_emf_loc = build / 'SED2+EMF/localisation'
+build_mini_lt = build / 'SED2+MiniSWMH/common/landed_titles'
+# build_emf_lt = build / 'SED2+EMF/common/landed_titles'
+# build_emfmini_lt = build / 'SED2+EMF+MiniSWMH/common/landed_titles'
+
 province_loc_files = [
     'A_SWMHcounties.csv', 'A_SWMHnewprovinces.csv', 'A_SWMHprovinces.csv']
 
+# name -> (glob, moddirs, basedir) of every file listing the build reads
+listing_globs = {
+    'templates_loc': ('*', [], templates_loc),
+    'swmh_loc': ('localisation/*', [], swmhpath),
+    'emf_loc': ('localisation/*', [emfswmhpath], emfpath),
+    'swmh_lt': ('common/landed_titles/*', [], swmhpath),
+    'mini_lt': ('common/landed_titles/*', [], minipath),
+    'definition': ('map/definition.csv', [swmhpath], vanilladir),
+    'default_map': ('map/default.map', [swmhpath], vanilladir),
+    'province_history': ('history/provinces/*', [swmhpath], vanilladir),
+    'cultures': ('common/cultures/*', [swmhpath], vanilladir)
+}
+province_listings = ['definition', 'default_map', 'province_history']
+
+# path: build output; inputs: files it is derived from; input_listings:
+# listings whose files it is derived from; listings: listings whose file
+# names alone decide it; derive: () -> its bytes
+Output = collections.namedtuple(
+    'Output', 'path inputs input_listings listings derive')
+
 def get_province_id(parser):
     province_id = {}
     province_title = {}
@@ -36,44 +78,61 @@ def get_province_id(parser):
         province_title[the_id] = title
     return province_id, province_title
 
-@print_time
-def main():
-    simple_parser = SimpleParser()
-    simple_parser.moddirs = [swmhpath]
-    full_parser = FullParser()
-    full_parser.newlines_to_depth = 0
-    templates = sed2path / 'templates'
-    templates_sed2 = templates / 'SED2'
-    templates_loc = templates_sed2 / 'localisation'
-    templates_lt = templates_sed2 / 'common/landed_titles'
-    templates_emf_loc = templates / 'SED2+EMF/localisation'
-    build = sed2path / 'build'
-    build_sed2 = build / 'SED2'
-    build_loc = build_sed2 / 'localisation'
-    build_lt = build_sed2 / 'common/landed_titles'
-    build_emf_loc = build / 'SED2+EMF/localisation'
-    build_mini_lt = build / 'SED2+MiniSWMH/common/landed_titles'
-    # build_emf_lt = build / 'SED2+EMF/common/landed_titles'
-    # build_emfmini_lt = build / 'SED2+EMF+MiniSWMH/common/landed_titles'
-    if build.exists():
-        print('Removing old build...')
-        shutil.rmtree(str(build))
-    build_loc.mkdir(parents=True)
-    build_lt.mkdir(parents=True)
-    build_emf_loc.mkdir(parents=True)
-    build_mini_lt.mkdir(parents=True)
-    # build_emf_lt.mkdir(parents=True)
-    # build_emfmini_lt.mkdir(parents=True)
-    swmh_files = set()
-    sed2 = {}
-    keys_to_blank = set()
+def relpath(path):
+    try:
+        return path.relative_to(rootpath).as_posix()
+    except ValueError:
+        return '<vanilla>/' + path.relative_to(vanilladir).as_posix()
+
+def fullpath(name):
+    if name.startswith('<vanilla>/'):
+        return vanilladir / name[len('<vanilla>/'):]
+    return rootpath / name
 
-    province_id, province_title = get_province_id(simple_parser)
+def hash_file(path):
+    try:
+        with path.open('rb') as f:
+            return relpath(path), hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return relpath(path), None
+
+def csv_bytes(rows):
+    f = io.StringIO(newline='')
+    csv.writer(f, dialect='ckii').writerows(rows)
+    return f.getvalue().encode('cp1252')
+
+def tree_bytes(tree, parser):
+    return tree.str(parser).replace('\n', '\r\n').encode('cp1252')
+
+def loc_header():
+    sed2rows = [[''] * 15]
+    sed2rows[0][:6] = ['#CODE', 'ENGLISH', 'FRENCH', 'GERMAN', '', 'SPANISH']
+    sed2rows[0][-1] = 'x'
+    return sed2rows
 
-    for path in files('localisation/*', basedir=swmhpath):
-        swmh_files.add(path.name)
+# fill a blank title adjective from the title's (or its province's) name
+def adj_fallback(sed2row, sed2, province_id):
+    match = re.fullmatch(r'([ekdcb]_.*)_adj', sed2row[0])
+    if match:
+        title = match.group(1)
+        if title.startswith('c'):
+            if title in province_id:
+                the_id = province_id[title]
+                if the_id in sed2:
+                    sed2row[1] = sed2[the_id]
+                    return True
+        else:
+            if title in sed2:
+                sed2row[1] = sed2[title]
+                return True
+    return False
 
-    for inpath in files('*', basedir=templates_loc):
+# yields (inpath, sed2, keys_to_blank) after reading each template, sharing
+# one table that grows as the templates are read
+def read_loc_templates(template_locs, swmh_files):
+    sed2 = {}
+    keys_to_blank = set()
+    for inpath in template_locs:
         for row in csv_rows(inpath, comments=True):
             key, val = row[0].strip(), row[1].strip()
             if not val:
@@ -86,48 +145,26 @@ def main():
                     sed2[key] = val
                 else:
                     print('Duplicate localisations for ' + key)
-        if inpath.name not in swmh_files:
-            outpath = build_loc / inpath.name
-            sed2rows = [[''] * 15]
-            sed2rows[0][:6] = [
-                '#CODE', 'ENGLISH', 'FRENCH', 'GERMAN', '', 'SPANISH']
-            sed2rows[0][-1] = 'x'
-            for row in csv_rows(inpath):
-                if no_provinces and re.match(r'[cb]_|PROV\d+', row[0]):
-                    continue
-                sed2row = [''] * 15
-                sed2row[0] = row[0].strip()
-                sed2row[1] = row[1].strip()
-                sed2row[-1] = 'x'
-                if sed2row[1] or sed2row[0] in keys_to_blank:
-                    sed2rows.append(sed2row)
-                elif not sed2row[1]:
-                    match = re.fullmatch(r'([ekdcb]_.*)_adj', sed2row[0])
-                    if match:
-                        title = match.group(1)
-                        if title.startswith('c'):
-                            if title in province_id:
-                                the_id = province_id[title]
-                                if the_id in sed2:
-                                    sed2row[1] = sed2[the_id]
-                                    sed2rows.append(sed2row)
-                        else:
-                            if title in sed2:
-                                sed2row[1] = sed2[title]
-                                sed2rows.append(sed2row)
-            print('Writing {}'.format(outpath))
-            with outpath.open('w', encoding='cp1252', newline='') as csvfile:
-                csv.writer(csvfile, dialect='ckii').writerows(sed2rows)
+        yield inpath, sed2, keys_to_blank
 
-    # EMF
-    # determine files overriding SWMH locs
-    overridden_files = swmh_files & {path.name for path in
-        files('localisation/*', [emfswmhpath], basedir=emfpath)}
-    inpath = templates_emf_loc / '0_SED+EMF.csv'
+def template_loc_bytes(inpath, sed2, keys_to_blank, province_id):
+    sed2rows = loc_header()
+    for row in csv_rows(inpath):
+        if no_provinces and re.match(r'[cb]_|PROV\d+', row[0]):
+            continue
+        sed2row = [''] * 15
+        sed2row[0] = row[0].strip()
+        sed2row[1] = row[1].strip()
+        sed2row[-1] = 'x'
+        if sed2row[1] or sed2row[0] in keys_to_blank:
+            sed2rows.append(sed2row)
+        elif adj_fallback(sed2row, sed2, province_id):
+            sed2rows.append(sed2row)
+    return csv_bytes(sed2rows)
+
+def emf_loc_bytes(inpath, sed2, keys_to_blank, overridden_files):
     original_file = None
-    sed2rows = [[''] * 15]
-    sed2rows[0][:6] = ['#CODE', 'ENGLISH', 'FRENCH', 'GERMAN', '', 'SPANISH']
-    sed2rows[0][-1] = 'x'
+    sed2rows = loc_header()
     for row in csv_rows(inpath, comments=True):
         if row[0].startswith('#CODE'):
             continue
@@ -146,106 +183,158 @@ def main():
             row[2] == row[3] and sed2.get(sed2row[0], row[2]) != row[2]):
             sed2row[1] = sed2.get(sed2row[0], '')
             sed2rows.append(sed2row)
-    outpath = build_emf_loc / inpath.name
-    print('Writing {}'.format(outpath))
-    with outpath.open('w', encoding='cp1252', newline='') as csvfile:
-        csv.writer(csvfile, dialect='ckii').writerows(sed2rows)
+    return csv_bytes(sed2rows)
+
+def swmh_loc_bytes(inpath, sed2, keys_to_blank, province_id):
+    sed2rows = loc_header()
+    for row in csv_rows(inpath):
+        sed2row = [''] * 15
+        sed2row[0] = row[0]
+        sed2row[1] = sed2.get(row[0], row[1])
+        sed2row[-1] = 'x'
+        if sed2row[1] or sed2row[0] in keys_to_blank:
+            sed2rows.append(sed2row)
+        elif adj_fallback(sed2row, sed2, province_id):
+            sed2rows.append(sed2row)
+    return csv_bytes(sed2rows)
+
+def read_lt_template(template):
+    sed2 = collections.defaultdict(list)
+    prev_title = None
+    seen_title_female = False
+    title_female_to_set = None
+    title_title_index = -1
+    for row in csv_rows(template):
+        title, key, val = (s.strip() for s in row[:3])
+        # default title_female to title
+        if prev_title != title:
+            if title_female_to_set and not seen_title_female:
+                sed2[prev_title].insert(title_title_index,
+                    Pair('title_female', title_female_to_set))
+            title_female_to_set = None
+            seen_title_female = False
+        if val:
+            if key in ['male_names', 'female_names']:
+                val = Obj([String(x.strip('"'))
+                           for x in re.findall(r'[^"\s]+|"[^"]*"', val)])
+            sed2[title].append(Pair(key, val))
+            if key == 'title':
+                title_title_index = len(sed2[title])
+                title_female_to_set = val
+        if key == 'title_female':
+            seen_title_female = True
+        prev_title = title
+    if title_female_to_set and not seen_title_female:
+        sed2[title].insert(title_title_index,
+            Pair('title_female', title_female_to_set))
+    return sed2
+
+def update_tree(v, sed2, lt_keys, cultures):
+    for n2, v2 in v:
+        if is_codename(n2.val):
+            if n2.val.startswith('b_') and not no_provinces:
+                for p3 in reversed(v2.contents):
+                    if p3.key.val in cultures:
+                        v2.contents.remove(p3)
+            elif not no_provinces or re.match(r'[ekd]_', n2.val):
+                for p3 in reversed(v2.contents):
+                    if p3.key.val in lt_keys:
+                        v2.contents.remove(p3)
+                if sed2[n2.val]:
+                    index = next(
+                        (i for i, (n3, _) in enumerate(v2)
+                         if is_codename(n3.val)), len(v2))
+                    v2.contents[index:index] = sed2[n2.val]
+            update_tree(v2, sed2, lt_keys, cultures)
+
+def lt_bytes(inpath, template, full_parser, lt_keys, cultures):
+    tree = full_parser.parse_file(inpath)
+    update_tree(tree, read_lt_template(template), lt_keys, cultures)
+    return tree_bytes(tree, full_parser)
+
+# every output of the build, in build order, and the relpaths in each
+# listing; only file listings are read here, anything parsed is deferred
+# until an output is derived
+def build_plan():
+    listings = {}
+    for name, (glob, moddirs, basedir) in listing_globs.items():
+        listings[name] = list(files(glob, moddirs, basedir=basedir))
+
+    swmh_files = {path.name for path in listings['swmh_loc']}
+    template_locs = listings['templates_loc']
+    loc_input_listings = ['templates_loc'] + province_listings
+
+    @functools.lru_cache(maxsize=None)
+    def simple_parser():
+        parser = SimpleParser()
+        parser.moddirs = [swmhpath]
+        return parser
 
-    for inpath in files('localisation/*', basedir=swmhpath):
+    @functools.lru_cache(maxsize=None)
+    def province_id():
+        return get_province_id(simple_parser())[0]
+
+    # standalone templates are derived from the table as read up to and
+    # including themselves; everything else from the full table
+    @functools.lru_cache(maxsize=None)
+    def loc_tables():
+        tables = {}
+        sed2, keys_to_blank = {}, set()
+        for inpath, sed2, keys_to_blank in read_loc_templates(template_locs,
+                                                             swmh_files):
+            if inpath.name not in swmh_files:
+                tables[inpath] = dict(sed2), set(keys_to_blank)
+        return tables, (sed2, keys_to_blank)
+
+    @functools.lru_cache(maxsize=None)
+    def lt_context():
+        full_parser = FullParser()
+        full_parser.newlines_to_depth = 0
+        cultures = get_cultures(simple_parser(), groups=False)
+        lt_keys = [
+            'title', 'title_female', 'foa', 'title_prefix', 'short_name',
+            'name_tier', 'location_ruler_title', 'dynasty_title_names',
+            'male_names'] + cultures
+        full_parser.fq_keys = cultures
+        return full_parser, lt_keys, cultures
+
+    plan = []
+    for inpath in template_locs:
+        if inpath.name not in swmh_files:
+            plan.append(Output(
+                build_loc / inpath.name, [], loc_input_listings,
+                ['swmh_loc'],
+                lambda inpath=inpath: template_loc_bytes(
+                    inpath, *loc_tables()[0][inpath], province_id())))
+
+    # EMF
+    # determine files overriding SWMH locs
+    emf_locs = listings['emf_loc']
+    overridden_files = swmh_files & {path.name for path in emf_locs}
+    inpath = templates_emf_loc / '0_SED+EMF.csv'
+    plan.append(Output(
+        build_emf_loc / inpath.name, [inpath], ['templates_loc'],
+        ['swmh_loc', 'emf_loc'],
+        lambda inpath=inpath: emf_loc_bytes(
+            inpath, *loc_tables()[1], overridden_files)))
+
+    for inpath in listings['swmh_loc']:
         if no_provinces and inpath.name in province_loc_files:
             continue
-        outpath = build_loc / inpath.name
-        sed2rows = [[''] * 15]
-        sed2rows[0][:6] = [
-            '#CODE', 'ENGLISH', 'FRENCH', 'GERMAN', '', 'SPANISH']
-        sed2rows[0][-1] = 'x'
-        for row in csv_rows(inpath):
-            sed2row = [''] * 15
-            sed2row[0] = row[0]
-            sed2row[1] = sed2.get(row[0], row[1])
-            sed2row[-1] = 'x'
-            if sed2row[1] or sed2row[0] in keys_to_blank:
-                sed2rows.append(sed2row)
-            elif not sed2row[1]:
-                match = re.fullmatch(r'([ekdcb]_.*)_adj', sed2row[0])
-                if match:
-                    title = match.group(1)
-                    if title.startswith('c'):
-                        if title in province_id:
-                            the_id = province_id[title]
-                            if the_id in sed2:
-                                sed2row[1] = sed2[the_id]
-                                sed2rows.append(sed2row)
-                    else:
-                        if title in sed2:
-                            sed2row[1] = sed2[title]
-                            sed2rows.append(sed2row)
-        print('Writing {}'.format(outpath))
-        with outpath.open('w', encoding='cp1252', newline='') as csvfile:
-            csv.writer(csvfile, dialect='ckii').writerows(sed2rows)
-
-    cultures = get_cultures(simple_parser, groups=False)
-    lt_keys = [
-        'title', 'title_female', 'foa', 'title_prefix', 'short_name',
-        'name_tier', 'location_ruler_title', 'dynasty_title_names',
-        'male_names'] + cultures
-    full_parser.fq_keys = cultures
-
-    def update_tree(v, sed2, lt_keys):
-        for n2, v2 in v:
-            if is_codename(n2.val):
-                if n2.val.startswith('b_') and not no_provinces:
-                    for p3 in reversed(v2.contents):
-                        if p3.key.val in cultures:
-                            v2.contents.remove(p3)
-                elif not no_provinces or re.match(r'[ekd]_', n2.val):
-                    for p3 in reversed(v2.contents):
-                        if p3.key.val in lt_keys:
-                            v2.contents.remove(p3)
-                    if sed2[n2.val]:
-                        index = next(
-                            (i for i, (n3, _) in enumerate(v2)
-                             if is_codename(n3.val)), len(v2))
-                        v2.contents[index:index] = sed2[n2.val]
-                update_tree(v2, sed2, lt_keys)
+        plan.append(Output(
+            build_loc / inpath.name, [inpath], loc_input_listings,
+            ['swmh_loc'],
+            lambda inpath=inpath: swmh_loc_bytes(
+                inpath, *loc_tables()[1], province_id())))
 
-    sed2 = {}
-    for inpath, tree in full_parser.parse_files('common/landed_titles/*',
-                                                basedir=swmhpath):
+    lt_templates = set()
+    for inpath in listings['swmh_lt']:
         template = templates_lt / inpath.with_suffix('.csv').name
-        outpath = build_lt / inpath.name
-        sed2[template] = collections.defaultdict(list)
-        prev_title = None
-        seen_title_female = False
-        title_female_to_set = None
-        title_title_index = -1
-        for row in csv_rows(template):
-            title, key, val = (s.strip() for s in row[:3])
-            # default title_female to title
-            if prev_title != title:
-                if title_female_to_set and not seen_title_female:
-                    sed2[template][prev_title].insert(title_title_index,
-                        Pair('title_female', title_female_to_set))
-                title_female_to_set = None
-                seen_title_female = False
-            if val:
-                if key in ['male_names', 'female_names']:
-                    val = Obj([String(x.strip('"'))
-                               for x in re.findall(r'[^"\s]+|"[^"]*"', val)])
-                sed2[template][title].append(Pair(key, val))
-                if key == 'title':
-                    title_title_index = len(sed2[template][title])
-                    title_female_to_set = val
-            if key == 'title_female':
-                seen_title_female = True
-            prev_title = title
-        if title_female_to_set and not seen_title_female:
-            sed2[template][title].insert(title_title_index,
-                Pair('title_female', title_female_to_set))
-        update_tree(tree, sed2[template], lt_keys)
-        print('Writing {}'.format(outpath))
-        with outpath.open('w', encoding='cp1252', newline='\r\n') as f:
-            f.write(tree.str(full_parser))
+        lt_templates.add(template)
+        plan.append(Output(
+            build_lt / inpath.name, [template, inpath], ['cultures'], [],
+            lambda inpath=inpath, template=template: lt_bytes(
+                inpath, template, *lt_context())))
 
     # for moddir, builddir in zip([emfswmhpath, minipath, emfminipath],
     #     [build_emf_lt, build_mini_lt, build_emfmini_lt]):
@@ -263,20 +352,170 @@ def main():
     #             with out.open('w', encoding='cp1252', newline='\r\n') as f:
     #                 f.write(tree.str(full_parser))
 
-    for inpath, tree in full_parser.parse_files('common/landed_titles/*',
-                                                basedir=minipath):
+    for inpath in listings['mini_lt']:
         template = templates_lt / inpath.with_suffix('.csv').name
-        if template in sed2:
-            outpath = build_mini_lt / inpath.name
-            update_tree(tree, sed2[template], lt_keys)
-            print('Writing {}'.format(outpath))
-            with outpath.open('w', encoding='cp1252', newline='\r\n') as f:
-                f.write(tree.str(full_parser))
+        if template in lt_templates:
+            plan.append(Output(
+                build_mini_lt / inpath.name, [template, inpath],
+                ['cultures'], ['swmh_lt'],
+                lambda inpath=inpath, template=template: lt_bytes(
+                    inpath, template, *lt_context())))
+    return plan, {name: [relpath(p) for p in paths]
+                  for name, paths in listings.items()}
+
+# each file is hashed and each listing stored once, outputs refer to them
+def write_manifest(plan, listings):
+    paths = {p for output in plan for p in [output.path, *output.inputs]}
+    paths.update(fullpath(p) for output in plan
+                 for name in output.input_listings for p in listings[name])
+    entries = {relpath(output.path): {
+                   'inputs': [relpath(p) for p in output.inputs],
+                   'input_listings': output.input_listings,
+                   'listings': output.listings}
+               for output in plan}
+    outpath = build / 'manifest.json'
+    print('Writing {}'.format(outpath))
+    with outpath.open('w', encoding='utf-8') as f:
+        json.dump({'version': version,
+                   'hashes': dict(map(hash_file, paths)),
+                   'listings': listings,
+                   'outputs': entries}, f, indent=0, sort_keys=True)
+
+# localisation templates in the same directory share one key namespace, as
+# they are merged into a single table by main; anything else stands alone
+def key_namespace(path):
+    return path.parent if path.parent.name == 'localisation' else path
+
+def check_template(path):
+    problems = []
+    try:
+        data = path.read_bytes()
+    except OSError as e:
+        problems.append({'type': 'error', 'path': relpath(path),
+                         'reason': str(e)})
+        return path, problems, []
+    try:
+        text = data.decode('cp1252')
+    except UnicodeDecodeError as e:
+        problems.append({'type': 'encoding', 'path': relpath(path),
+                         'offset': e.start, 'reason': e.reason})
+        text = data.decode('cp1252', errors='replace')
+    keys = []
+    is_lt = path.parent.name == 'landed_titles'
+    reader = csv.reader(io.StringIO(text, newline=''), dialect='ckii')
+    for row in reader:
+        if not row or row[0].strip().startswith('#'):
+            continue
+        if len(row) < 2:
+            problems.append({'type': 'error', 'path': relpath(path),
+                             'line': reader.line_num, 'row': row,
+                             'reason': 'expected at least 2 columns'})
+            continue
+        keys.append((row[0].strip(), row[1].strip()) if is_lt else
+                    row[0].strip())
+    return path, problems, keys
+
+# outputs whose recorded inputs or listings changed are re-derived and
+# compared with build, so only a real difference is reported as stale
+def verify():
+    problems = []
+    try:
+        with (build / 'manifest.json').open(encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {'version': None, 'hashes': {}, 'listings': {},
+                    'outputs': {}}
+        problems.append({'type': 'missing',
+                         'path': relpath(build / 'manifest.json'),
+                         'reason': 'run a full build to record it'})
+    if manifest['version'] not in (None, version):
+        problems.append({'type': 'version', 'expected': version,
+                         'found': manifest['version']})
+    recorded = manifest['outputs']
+    recorded_hashes = manifest['hashes']
+    recorded_listings = manifest['listings']
+    plan, listings = build_plan()
+    planned = {relpath(output.path) for output in plan}
+    for out in sorted(recorded.keys() - planned):
+        problems.append({'type': 'unexpected', 'path': out})
+    relisted_names = {name for name, paths in listings.items()
+                      if recorded_listings.get(name) != paths}
+    paths = map(fullpath, recorded_hashes)
+    seen = collections.defaultdict(dict)
+    with multiprocessing.Pool() as pool:
+        hashes = dict(pool.imap_unordered(hash_file, paths, chunksize=32))
+        for path, file_problems, keys in pool.imap(
+            check_template, sorted(templates.rglob('*.csv')), chunksize=4):
+            problems.extend(file_problems)
+            namespace = seen[key_namespace(path)]
+            for key in keys:
+                if key in namespace:
+                    problems.append({'type': 'duplicate',
+                                     'path': relpath(path),
+                                     'key': key,
+                                     'first': namespace[key]})
+                else:
+                    namespace[key] = relpath(path)
+    changed_files = {p for p, h in recorded_hashes.items() if hashes[p] != h}
+    for output in plan:
+        out = relpath(output.path)
+        if out not in recorded:
+            problems.append({'type': 'unrecorded', 'path': out})
+            continue
+        entry = recorded[out]
+        inputs = set(entry['inputs'])
+        for name in entry['input_listings']:
+            inputs.update(recorded_listings.get(name, []))
+        changed = sorted(inputs & changed_files)
+        relisted = sorted(relisted_names & {*entry['input_listings'],
+                                            *entry['listings']})
+        if hashes.get(out) is None:
+            problems.append({'type': 'missing', 'path': out})
+        elif changed or relisted:
+            try:
+                # keep stdout machine-readable
+                with contextlib.redirect_stdout(sys.stderr):
+                    data = output.derive()
+                stale = data != output.path.read_bytes()
+            except (UnicodeError, OSError) as e:
+                problems.append({'type': 'error', 'path': out,
+                                 'reason': str(e)})
+                continue
+            if stale:
+                problems.append({'type': 'stale', 'path': out,
+                                 'inputs': changed, 'listings': relisted})
+        elif hashes[out] != recorded_hashes[out]:
+            problems.append({'type': 'modified', 'path': out})
+    for problem in problems:
+        print(json.dumps(problem, sort_keys=True))
+    return 1 if problems else 0
+
+@print_time
+def main():
+    if build.exists():
+        print('Removing old build...')
+        shutil.rmtree(str(build))
+    build_loc.mkdir(parents=True)
+    build_lt.mkdir(parents=True)
+    build_emf_loc.mkdir(parents=True)
+    build_mini_lt.mkdir(parents=True)
+    # build_emf_lt.mkdir(parents=True)
+    # build_emfmini_lt.mkdir(parents=True)
+
+    plan, listings = build_plan()
+    for output in plan:
+        data = output.derive()
+        print('Writing {}'.format(output.path))
+        output.path.write_bytes(data)
 
     with (build_sed2 / 'version.txt').open('w', encoding='cp1252',
                                       newline='\r\n') as f:
         print('Writing {}'.format(build_sed2 / 'version.txt'))
         print('{} - {}'.format(version, datetime.date.today()), file=f)
 
+    write_manifest(plan, listings)
+
 if __name__ == '__main__':
+    if verify_only:
+        sys.exit(verify())
     main()
@@ -45,7 +45,8 @@ def get_dynamics(parser, cultures, prov_id):
     return dynamics
 
 def get_gov_locs(parser):
-    prefixes = []
+    # dicts as insertion-ordered sets
+    prefixes = {}
     names = []
     for _, tree in parser.parse_files('common/governments/*.txt'):
         for _, v in tree:
@@ -55,13 +56,19 @@ def get_gov_locs(parser):
                     prefix = v2['title_prefix'].val
                 except KeyError:
                     continue
-                if prefix not in prefixes:
-                    prefixes.append(prefix)
-    return prefixes, names
+                prefixes[prefix] = None
+    return list(prefixes), names
+
+# partition keys (an insertion-ordered dict) into the set found in
+# localisation and an insertion-ordered dict of the rest
+def split_localised(keys, localisation):
+    missing = {k: None for k in keys if k not in localisation}
+    return keys.keys() - missing.keys(), missing
 
 def get_more_keys_to_override(parser, localisation, max_provs):
     override = set()
-    missing_loc = []
+    # dicts as insertion-ordered sets
+    loc_keys = {}
     for _, tree in parser.parse_files('common/bookmarks/*.txt'):
         for n, v in tree:
             override.add(v['name'].val)
@@ -87,14 +94,14 @@ def get_more_keys_to_override(parser, localisation, max_provs):
                 for n3, v3 in v2:
                     if n3.val == 'desc':
                         override.add(v3.val)
-    ul_titles = []
+    ul_titles = {}
     for _, tree in parser.parse_files('common/job_titles/*.txt'):
         for n, v in tree:
-            ul_titles.append(n.val)
+            ul_titles[n.val] = None
             override.add('desc_' + n.val)
     for _, tree in parser.parse_files('common/minor_titles/*.txt'):
         for n, v in tree:
-            ul_titles.append(n.val)
+            ul_titles[n.val] = None
             override.add(n.val + '_FOA')
             override.add(n.val + '_desc')
     for _, tree in parser.parse_files('common/retinue_subunits/*.txt'):
@@ -131,27 +138,19 @@ def get_more_keys_to_override(parser, localisation, max_provs):
                 elif (parents not in bl_pars and
                       n.val in ['set_name', 'adjective'] and v.val.strip() and
                       not re.match('\[|event_target', v.val)):
-                    if v.val in localisation:
-                        override.add(v.val)
-                    elif v.val not in missing_loc:
-                        missing_loc.append(v.val)
+                    loc_keys[v.val] = None
     for glob in ['history/provinces/*.txt', 'history/titles/*.txt']:
         for path, tree in parser.parse_files(glob):
             for n, v in tree:
                 if isinstance(n, Date):
                     for n2, v2 in v:
                         if n2.val in ['name', 'adjective'] and v2.val.strip():
-                            if v2.val in localisation:
-                                override.add(v2.val)
-                            elif v2.val not in missing_loc:
-                                missing_loc.append(v2.val)
-    for i in range(1, max_provs):
-        key = 'PROV{}'.format(i)
-        if key in localisation:
-            override.add(key)
-        elif key not in missing_loc:
-            missing_loc.append(key)
-    return override, missing_loc, ul_titles
+                            loc_keys[v2.val] = None
+    loc_keys.update(dict.fromkeys(
+        'PROV{}'.format(i) for i in range(1, max_provs)))
+    found, missing_loc = split_localised(loc_keys, localisation)
+    override |= found
+    return override, missing_loc, list(ul_titles)
 
 def get_max_provinces(parser):
     return parser.parse_file('map/default.map')['max_provinces'].val